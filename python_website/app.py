@@ -1,4 +1,5 @@
 from flask import Flask, render_template, jsonify
+import atexit
 from datetime import datetime, timedelta
 import random
 from database import db
@@ -201,11 +202,16 @@ def api_sensor_data():
     # Fallback to generated data
     return jsonify(generate_fallback_sensor_data())
 
-# Clean up database connection when Flask is shutting down
-@app.teardown_appcontext
-def close_db_connection(exception):
+# Clean up database connection when the process exits. The client is shared
+# by every request in this worker, so it must not be closed per request.
+@atexit.register
+def close_db_connection():
     if db.client:
         db.close_connection()
 
 if __name__ == '__main__':
+    # The dev server seeds the database itself; in production that is done
+    # by workers.py and the web tier is served by gunicorn (see wsgi.py)
+    if db.client:
+        db.initialize()
     app.run(debug=True, port=5000)
@@ -4,14 +4,15 @@ MongoDB Database Configuration and Connection
 from pymongo import MongoClient
 from datetime import datetime, timedelta
 import random
+import csv
 import os
 
 class AquaTechDB:
-    def __init__(self):
+    def __init__(self, initialize=False, database_name='aquatech_db'):
         # MongoDB connection string - using local MongoDB instance
         # For production, you would use a cloud service like MongoDB Atlas
         self.connection_string = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
-        self.database_name = 'aquatech_db'
+        self.database_name = database_name
         
         try:
             self.client = MongoClient(self.connection_string)
@@ -26,12 +27,12 @@ class AquaTechDB:
             self.feeding_schedules = self.db.feeding_schedules
             self.alerts = self.db.alerts
             self.system_settings = self.db.system_settings
+            self.sensor_rollups = self.db.sensor_rollups
             
-            # Create indexes for better performance
-            self.create_indexes()
-            
-            # Initialize with sample data if empty
-            self.initialize_sample_data()
+            # Index creation and seeding are write-heavy, so only the worker
+            # process (or the dev server) asks for them; web workers only read
+            if initialize:
+                self.initialize()
             
         except Exception as e:
             print(f"❌ MongoDB connection failed: {e}")
@@ -39,18 +40,36 @@ class AquaTechDB:
             self.client = None
             self.db = None
     
+    def initialize(self):
+        """Create indexes and seed sample data"""
+        # Create indexes for better performance
+        self.create_indexes()
+        
+        # Initialize with sample data if empty
+        self.initialize_sample_data()
+    
     def create_indexes(self):
         """Create database indexes for better query performance"""
         try:
             # Index on timestamp for sensor data (for time-based queries)
             self.sensor_data.create_index([("timestamp", -1)])
             
-            # Index on feeding schedule times
-            self.feeding_schedules.create_index([("time", 1), ("date", 1)])
+            # Index on feeding schedules: equality on date first, then the time sort
+            self.feeding_schedules.create_index([("date", 1), ("time", 1)])
+            
+            # Earlier versions created this index in the wrong order for that query
+            if "time_1_date_1" in self.feeding_schedules.index_information():
+                self.feeding_schedules.drop_index("time_1_date_1")
             
             # Index on alert timestamps
             self.alerts.create_index([("timestamp", -1)])
             
+            # Index on the reading an alert was raised for (alert evaluation)
+            self.alerts.create_index([("reading_id", 1)])
+            
+            # Index on rollup buckets (rollup counts and retention)
+            self.sensor_rollups.create_index([("_id.hour", 1)])
+            
             print("✅ Database indexes created successfully")
         except Exception as e:
             print(f"⚠️ Index creation failed: {e}")
@@ -58,20 +77,21 @@ class AquaTechDB:
     def initialize_sample_data(self):
         """Initialize the database with sample data if it's empty"""
         try:
-            # Check if we already have data
-            if self.sensor_data.count_documents({}) == 0:
+            # Check if we already have data (find_one stops at the first document,
+            # count_documents would scan the whole collection)
+            if self.sensor_data.find_one({}, {"_id": 1}) is None:
                 print("📊 Initializing database with sample sensor data...")
                 self.seed_sensor_data()
             
-            if self.feeding_schedules.count_documents({}) == 0:
+            if self.feeding_schedules.find_one({}, {"_id": 1}) is None:
                 print("🐟 Initializing feeding schedules...")
                 self.seed_feeding_data()
             
-            if self.alerts.count_documents({}) == 0:
+            if self.alerts.find_one({}, {"_id": 1}) is None:
                 print("🚨 Initializing system alerts...")
                 self.seed_alerts_data()
                 
-            if self.system_settings.count_documents({}) == 0:
+            if self.system_settings.find_one({}, {"_id": 1}) is None:
                 print("⚙️ Initializing system settings...")
                 self.seed_system_settings()
                 
@@ -106,7 +126,8 @@ class AquaTechDB:
     
     def seed_feeding_data(self):
         """Create feeding schedules for today"""
-        today = datetime.now().date()
+        # BSON has no date-only type, so schedules are keyed by midnight
+        today = datetime.combine(datetime.now().date(), datetime.min.time())
         
         feeding_schedule = [
             {
@@ -261,7 +282,7 @@ class AquaTechDB:
     def get_todays_feeding_schedule(self):
         """Get feeding schedule for today"""
         try:
-            today = datetime.now().date()
+            today = datetime.combine(datetime.now().date(), datetime.min.time())
             
             cursor = self.feeding_schedules.find(
                 {"date": today},
@@ -272,7 +293,7 @@ class AquaTechDB:
             for feeding in cursor:
                 feeding['_id'] = str(feeding['_id'])
                 # Convert date to string for JSON serialization
-                feeding['date'] = feeding['date'].isoformat()
+                feeding['date'] = feeding['date'].date().isoformat()
                 schedule.append(feeding)
             
             return schedule
@@ -308,11 +329,188 @@ class AquaTechDB:
             print(f"❌ Error inserting sensor data: {e}")
             return None
     
+    # The job methods below run in workers.py and raise on failure, so the
+    # worker pool can count failed runs instead of logging them as successes
+    
+    def rollup_sensor_data(self, hours=24):
+        """Aggregate sensor readings into hourly averages in sensor_rollups"""
+        start_time = datetime.now() - timedelta(hours=hours)
+        
+        pipeline = [
+            {"$match": {"timestamp": {"$gte": start_time}}},
+            {"$group": {
+                "_id": {
+                    "sensor_id": "$sensor_id",
+                    "hour": {"$dateFromParts": {
+                        "year": {"$year": "$timestamp"},
+                        "month": {"$month": "$timestamp"},
+                        "day": {"$dayOfMonth": "$timestamp"},
+                        "hour": {"$hour": "$timestamp"}
+                    }}
+                },
+                "location": {"$first": "$location"},
+                "readings": {"$sum": 1},
+                "ph": {"$avg": "$ph"},
+                "temperature": {"$avg": "$temperature"},
+                "dissolved_oxygen": {"$avg": "$dissolved_oxygen"},
+                "turbidity": {"$avg": "$turbidity"},
+                "salinity": {"$avg": "$salinity"},
+                "ammonia": {"$avg": "$ammonia"}
+            }},
+            # Upsert so re-running a window refreshes its buckets
+            {"$merge": {"into": "sensor_rollups", "on": "_id", "whenMatched": "replace"}}
+        ]
+        
+        self.sensor_data.aggregate(pipeline)
+        return self.sensor_rollups.count_documents({"_id.hour": {"$gte": start_time.replace(minute=0, second=0, microsecond=0)}})
+    
+    def evaluate_alerts(self, batch_size=1000, overlap_minutes=5):
+        """Check every sensor reading since the last evaluation against the configured thresholds"""
+        settings = self.system_settings.find_one()
+        if not settings:
+            return 0
+        thresholds = settings.get("alert_thresholds", {})
+        
+        # The first run only checks the newest reading
+        last_evaluated = settings.get("alert_evaluation", {}).get("last_evaluated")
+        if not last_evaluated:
+            latest = self.sensor_data.find_one(sort=[("timestamp", -1)])
+            if not latest:
+                return 0
+            raised = self.raise_threshold_alerts([latest], thresholds)
+            self.system_settings.update_one(
+                {"_id": settings['_id']},
+                {"$max": {"alert_evaluation.last_evaluated": latest['timestamp']}}
+            )
+            return raised
+        
+        # Re-check a short window before the watermark to catch readings that were
+        # committed late with an older timestamp; the reading_id dedupe skips repeats
+        since = last_evaluated - timedelta(minutes=overlap_minutes)
+        raised = 0
+        while True:
+            readings = list(self.sensor_data.find(
+                {"timestamp": {"$gt": since}},
+                sort=[("timestamp", 1)],
+                limit=batch_size
+            ))
+            if not readings:
+                break
+            
+            raised += self.raise_threshold_alerts(readings, thresholds)
+            
+            # Advance the watermark per batch so a failure doesn't redo finished batches
+            since = readings[-1]['timestamp']
+            self.system_settings.update_one(
+                {"_id": settings['_id']},
+                {"$max": {"alert_evaluation.last_evaluated": since}}
+            )
+            
+            if len(readings) < batch_size:
+                break
+        
+        return raised
+    
+    def raise_threshold_alerts(self, readings, thresholds):
+        """Insert a warning alert for every threshold a reading breaches"""
+        checks = [
+            ("ph", "ph_min", lambda v, t: v < t, "pH level below minimum threshold"),
+            ("ph", "ph_max", lambda v, t: v > t, "pH level above maximum threshold"),
+            ("temperature", "temp_min", lambda v, t: v < t, "Water temperature below minimum threshold"),
+            ("temperature", "temp_max", lambda v, t: v > t, "Water temperature above maximum threshold"),
+            ("dissolved_oxygen", "do_min", lambda v, t: v < t, "Dissolved oxygen below minimum threshold"),
+            ("turbidity", "turbidity_max", lambda v, t: v > t, "Turbidity above maximum threshold"),
+            ("ammonia", "ammonia_max", lambda v, t: v > t, "Ammonia above maximum threshold")
+        ]
+        
+        # Each reading is evaluated once, however often the job runs
+        evaluated = set(self.alerts.distinct(
+            "reading_id",
+            {"reading_id": {"$in": [reading['_id'] for reading in readings]}}
+        ))
+        
+        alerts = []
+        for reading in readings:
+            if reading['_id'] in evaluated:
+                continue
+            for field, key, breached, message in checks:
+                value = reading.get(field)
+                threshold = thresholds.get(key)
+                if value is None or threshold is None or not breached(value, threshold):
+                    continue
+                alerts.append({
+                    "timestamp": datetime.now(),
+                    "type": "warning",
+                    "message": message,
+                    "sensor_id": reading.get("sensor_id"),
+                    "reading_id": reading['_id'],
+                    "value": value,
+                    "threshold": threshold,
+                    "acknowledged": False
+                })
+        
+        if alerts:
+            self.alerts.insert_many(alerts)
+        return len(alerts)
+    
+    def export_sensor_data(self, directory, hours=24):
+        """Write sensor readings for the specified number of hours to a CSV file"""
+        fields = ["timestamp", "sensor_id", "location", "ph", "temperature",
+                  "dissolved_oxygen", "turbidity", "salinity", "ammonia"]
+        
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"sensor_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+        
+        start_time = datetime.now() - timedelta(hours=hours)
+        cursor = self.sensor_data.find(
+            {"timestamp": {"$gte": start_time}},
+            {field: 1 for field in fields},
+            sort=[("timestamp", 1)]
+        )
+        
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+            writer.writeheader()
+            for record in cursor:
+                record['timestamp'] = record['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
+                writer.writerow(record)
+        
+        return path
+    
+    def purge_old_data(self, days=30):
+        """Delete sensor readings, rollups and acknowledged alerts older than the retention window"""
+        cutoff = datetime.now() - timedelta(days=days)
+        
+        removed = self.sensor_data.delete_many({"timestamp": {"$lt": cutoff}}).deleted_count
+        removed += self.sensor_rollups.delete_many({"_id.hour": {"$lt": cutoff}}).deleted_count
+        removed += self.alerts.delete_many({
+            "timestamp": {"$lt": cutoff},
+            "acknowledged": True
+        }).deleted_count
+        
+        return removed
+    
+    def purge_old_exports(self, directory, days=30):
+        """Delete CSV exports older than the retention window"""
+        if not os.path.isdir(directory):
+            return 0
+        
+        cutoff = (datetime.now() - timedelta(days=days)).timestamp()
+        removed = 0
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.startswith("sensor_data_") and name.endswith(".csv") and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        
+        return removed
+    
     def close_connection(self):
         """Close the MongoDB connection"""
         if self.client:
             self.client.close()
             print("🔒 MongoDB connection closed")
 
-# Global database instance
-db = AquaTechDB()
+# Global database instance. Tools that only need the class (index_advisor.py)
+# set AQUATECH_SKIP_GLOBAL_DB=1 before importing, so no live connection is opened.
+db = None if os.getenv('AQUATECH_SKIP_GLOBAL_DB') == '1' else AquaTechDB()
@@ -0,0 +1,14 @@
+"""
+Gunicorn configuration for the AquaTech web tier
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('AQUATECH_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('AQUATECH_THREADS', '2'))
+timeout = 30
+accesslog = '-'
+
+# Don't preload the app: each web worker must open its own MongoClient after forking
+preload_app = False
@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+"""
+Query Plan Auditor and Index Advisor for AquaTech
+
+Finds every query shape AquaTechDB issues by running each of its methods
+against a seeded scratch database while a command listener records the
+queries they send. It then runs explain() on each shape and flags:
+1. Collection scans (COLLSCAN) that examine more documents than they return
+2. In-memory sorts (a SORT stage instead of reading an index in order)
+3. Indexes whose key order doesn't follow equality, sort, range
+
+For every flagged query it recommends an index built in that order. It also
+checks every existing index and recommends dropping the ones that are badly
+ordered for the queries they serve or duplicated by a longer index.
+
+Usage:
+    python index_advisor.py            # audit the live database
+    python index_advisor.py --apply    # audit and create recommended indexes
+    python index_advisor.py --drop     # audit and drop indexes flagged for removal
+    python index_advisor.py --check    # audit a large scratch database and fail
+                                       # if any query scans a collection
+"""
+
+import argparse
+import copy
+import inspect
+import os
+import random
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import monitoring
+
+# Only the class is needed here, so stop database.py opening its shared live connection
+os.environ['AQUATECH_SKIP_GLOBAL_DB'] = '1'
+from database import AquaTechDB
+
+SCRATCH_DATABASE = "aquatech_db_index_check"
+
+# Commands that select documents and so go through the query planner
+RECORDED_COMMANDS = {"find", "aggregate", "distinct", "count", "delete", "update"}
+
+# Methods that don't query: connection handling, index creation and seeding
+NOT_QUERIES = {"__init__", "initialize", "create_indexes", "close_connection"}
+
+# Methods that are only called from another method, whose queries cover them
+INDIRECT_METHODS = {"raise_threshold_alerts": "evaluate_alerts"}
+
+# Arguments for methods with required parameters, given a scratch directory
+METHOD_ARGS = {
+    "export_sensor_data": lambda workdir: (workdir,),
+    "purge_old_exports": lambda workdir: (workdir,),
+    "insert_sensor_reading": lambda workdir: ({
+        "ph": 7.2,
+        "temperature": 24.5,
+        "dissolved_oxygen": 8.1,
+        "turbidity": 12.0,
+        "salinity": 25.0,
+        "ammonia": 0.2,
+        "location": "Tank A",
+        "sensor_id": "SENSOR_001"
+    },)
+}
+
+# Index options that change behaviour, not just speed; never drop these automatically
+PROTECTED_OPTIONS = ("unique", "expireAfterSeconds", "partialFilterExpression", "sparse")
+
+RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte", "$ne", "$nin", "$exists", "$regex"}
+
+# Rank of each part of an index key: equality fields, then sort fields, then range fields
+EQUALITY, SORT, RANGE = 0, 1, 2
+ROLE_NAMES = {EQUALITY: "equality", SORT: "sort", RANGE: "range"}
+
+class QueryRecorder(monitoring.CommandListener):
+    """Records the query commands sent while an AquaTechDB method runs"""
+    def __init__(self):
+        self.method = None
+        self.commands = []
+
+    def started(self, event):
+        if self.method and event.command_name in RECORDED_COMMANDS:
+            self.commands.append((self.method, event.command_name, copy.deepcopy(event.command)))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+def command_queries(command_name, command):
+    """Turn a recorded command into (filter, sort, limit) for each query it runs"""
+    if command_name == "find":
+        yield command.get("filter", {}), list(command.get("sort", {}).items()), command.get("limit")
+    elif command_name == "aggregate":
+        # Only a leading $match (and a $sort right after it) can use an index
+        pipeline = command.get("pipeline", [])
+        match = pipeline[0].get("$match", {}) if pipeline else {}
+        sort = pipeline[1].get("$sort", {}) if len(pipeline) > 1 and match else {}
+        yield match, list(sort.items()), None
+    elif command_name in ("distinct", "count"):
+        yield command.get("query", {}), [], None
+    elif command_name == "delete":
+        for delete in command["deletes"]:
+            yield delete["q"], [], delete.get("limit") or None
+    elif command_name == "update":
+        for update in command["updates"]:
+            yield update["q"], [], None if update.get("multi") else 1
+
+def field_roles(shape):
+    """Map every field the query touches to EQUALITY, SORT or RANGE"""
+    roles = {}
+    for field, value in shape["filter"].items():
+        is_range = isinstance(value, dict) and any(op in RANGE_OPERATORS for op in value)
+        roles[field] = RANGE if is_range else EQUALITY
+    for field, _ in shape.get("sort", []):
+        # A field used for both equality and sort only needs its equality slot
+        roles.setdefault(field, SORT)
+    return roles
+
+def build_shapes(commands):
+    """Group recorded commands into distinct query shapes"""
+    shapes = {}
+    for method, command_name, command in commands:
+        collection = command[command_name]
+        for query_filter, sort, limit in command_queries(command_name, command):
+            shape = {"collection": collection, "filter": query_filter, "sort": sort, "limit": limit}
+            key = (collection, tuple(sorted(field_roles(shape).items())), tuple(sort), limit)
+            if key not in shapes:
+                shape["used_by"] = []
+                shapes[key] = shape
+            if method not in shapes[key]["used_by"]:
+                shapes[key]["used_by"].append(method)
+    return list(shapes.values())
+
+def collect_query_shapes(db, recorder):
+    """Run every AquaTechDB method and return the query shapes it issued
+
+    Also returns the methods that couldn't be run because nobody told the
+    advisor what arguments to pass them.
+    """
+    methods = [
+        (name, function) for name, function in inspect.getmembers(AquaTechDB, inspect.isfunction)
+        if name not in NOT_QUERIES and name not in INDIRECT_METHODS and not name.startswith("seed_")
+    ]
+    # Purges run last so every other method sees the full dataset
+    methods.sort(key=lambda method: (method[0].startswith("purge_"), method[0]))
+
+    skipped = []
+    workdir = tempfile.mkdtemp(prefix="aquatech_advisor_")
+    try:
+        for name, function in methods:
+            parameters = list(inspect.signature(function).parameters.values())[1:]
+            required = [p for p in parameters if p.default is p.empty]
+            if required and name not in METHOD_ARGS:
+                skipped.append(name)
+                continue
+
+            args = METHOD_ARGS[name](workdir) if required else ()
+            recorder.method = name
+            try:
+                getattr(db, name)(*args)
+            finally:
+                recorder.method = None
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return build_shapes(recorder.commands), skipped
+
+def recommended_index(shape):
+    """Build the index key for a query shape: equality, then sort, then range"""
+    roles = field_roles(shape)
+    sort = dict(shape.get("sort", []))
+
+    key = [(field, 1) for field, role in roles.items() if role == EQUALITY]
+    key += [(field, direction) for field, direction in shape.get("sort", []) if roles[field] == SORT]
+    key += [(field, sort.get(field, 1)) for field, role in roles.items() if role == RANGE]
+    return key
+
+def plan_stages(plan):
+    """Yield every stage in a winning plan tree"""
+    if not plan:
+        return
+    # Slot-based engine plans nest the classic tree under queryPlan
+    if "queryPlan" in plan:
+        plan = plan["queryPlan"]
+    yield plan
+    for child_key in ("inputStage", "inputStages", "thenStage", "elseStage"):
+        child = plan.get(child_key)
+        if isinstance(child, list):
+            for stage in child:
+                yield from plan_stages(stage)
+        elif child:
+            yield from plan_stages(child)
+
+def bad_key_order(index_key, roles):
+    """Return True if an index puts a query's fields out of equality, sort, range order"""
+    ranks = [roles[field] for field, _ in index_key if field in roles]
+    return ranks != sorted(ranks)
+
+def has_index_prefix(collection, key):
+    """Return True if an existing index already starts with the given key"""
+    for info in collection.index_information().values():
+        if [(field, direction) for field, direction in info["key"]][:len(key)] == key:
+            return True
+    return False
+
+def audit_indexes(db, shapes):
+    """Find existing indexes that should be dropped
+
+    An index is flagged when a longer index starts with the same keys, or when
+    it breaks equality, sort, range order for a query and follows it for none.
+    Indexes with options that change behaviour (unique, TTL, partial, sparse)
+    are reported but marked protected so they are never dropped automatically.
+    """
+    findings = []
+    for name in sorted({shape["collection"] for shape in shapes}):
+        collection = db.db[name]
+        roles = [field_roles(shape) for shape in shapes if shape["collection"] == name]
+        information = {index_name: info for index_name, info in collection.index_information().items() if index_name != "_id_"}
+        indexes = {index_name: [(field, direction) for field, direction in info["key"]] for index_name, info in information.items()}
+
+        for index_name, key in indexes.items():
+            reason = None
+            for other_name, other in indexes.items():
+                if other_name != index_name and len(other) > len(key) and other[:len(key)] == key:
+                    reason = f"duplicated by {other_name} {other}"
+                    break
+
+            if reason is None:
+                # Only queries whose fields the index leads with can use it
+                relevant = [query for query in roles if key[0][0] in query]
+                if relevant and all(bad_key_order(key, query) for query in relevant):
+                    reason = "keys out of equality, sort, range order for every query that uses it"
+
+            if reason:
+                options = [option for option in PROTECTED_OPTIONS if option in information[index_name]]
+                findings.append({
+                    "collection": name,
+                    "index": index_name,
+                    "key": key,
+                    "reason": reason,
+                    "protected": options
+                })
+
+    return findings
+
+def explain_shape(db, shape):
+    """Run explain() on a query shape and report what is wrong with its plan"""
+    collection = db.db[shape["collection"]]
+
+    cursor = collection.find(shape["filter"])
+    if shape.get("sort"):
+        cursor = cursor.sort(shape["sort"])
+    if shape.get("limit"):
+        cursor = cursor.limit(shape["limit"])
+    explain = cursor.explain()
+
+    stages = list(plan_stages(explain["queryPlanner"]["winningPlan"]))
+    stage_names = [stage.get("stage") for stage in stages]
+    index_keys = [list(stage["keyPattern"].items()) for stage in stages if stage.get("stage") == "IXSCAN"]
+    stats = explain.get("executionStats", {})
+    docs_examined = stats.get("totalDocsExamined", 0)
+    returned = stats.get("nReturned", 0)
+
+    roles = field_roles(shape)
+    issues = []
+    # A scan that returns everything it reads (an unfiltered find_one, say) can't be helped by an index
+    if "COLLSCAN" in stage_names and docs_examined > returned:
+        issues.append("COLLSCAN")
+    if "SORT" in stage_names:
+        issues.append("in-memory SORT")
+    for key in index_keys:
+        if bad_key_order(key, roles):
+            issues.append(f"bad key order in index {key}")
+
+    recommendation = None
+    if issues:
+        key = recommended_index(shape)
+        if key and not has_index_prefix(collection, key):
+            recommendation = key
+
+    return {
+        "shape": shape,
+        "stages": stage_names,
+        "indexes": index_keys,
+        "docs_examined": docs_examined,
+        "returned": returned,
+        "issues": issues,
+        "recommendation": recommendation
+    }
+
+def describe(shape):
+    """Describe a query shape without its concrete values"""
+    roles = ", ".join(f"{field}: {ROLE_NAMES[role]}" for field, role in field_roles(shape).items())
+    return f"{shape['collection']} {{{roles}}} sort={shape['sort']} limit={shape['limit']}"
+
+def audit(db, shapes, apply=False, drop=False):
+    """Explain every query shape, check existing indexes and print a report"""
+    print(f"🔍 Auditing query plans in {db.database_name}...")
+    print("=" * 50)
+
+    results = []
+    for shape in shapes:
+        result = explain_shape(db, shape)
+        results.append(result)
+
+        status = "⚠️" if result["issues"] else "✅"
+        print(f"\n{status} {describe(shape)}")
+        print(f"   Used by: {', '.join(shape['used_by'])}")
+        print(f"   Plan: {' <- '.join(result['stages'])}")
+        print(f"   Examined {result['docs_examined']} documents to return {result['returned']}")
+        for issue in result["issues"]:
+            print(f"   ❌ {issue}")
+        if result["recommendation"]:
+            print(f"   💡 Recommended index: {result['recommendation']}")
+
+    recommendations = []
+    for result in results:
+        entry = (result["shape"]["collection"], result["recommendation"])
+        if result["recommendation"] and entry not in recommendations:
+            recommendations.append(entry)
+
+    drops = audit_indexes(db, shapes)
+    if drops:
+        print("\n🗑️ Indexes to drop:")
+        for finding in drops:
+            print(f"   {finding['collection']}.{finding['index']} {finding['key']}: {finding['reason']}")
+            if finding["protected"]:
+                print(f"      🔒 Has {', '.join(finding['protected'])}; drop it by hand if it is really unused")
+
+    if apply:
+        for collection, key in recommendations:
+            db.db[collection].create_index(key)
+            print(f"✅ Created index {key} on {collection}")
+
+    if drop:
+        for finding in drops:
+            if finding["protected"]:
+                continue
+            db.db[finding["collection"]].drop_index(finding["index"])
+            print(f"✅ Dropped index {finding['index']} on {finding['collection']}")
+
+    return results
+
+def seed_large_dataset(db, readings=50000):
+    """Fill a scratch database with enough data for the query planner to care"""
+    print(f"📊 Seeding {readings} sensor readings...")
+    now = datetime.now()
+    batch = []
+    for minute in range(readings):
+        batch.append({
+            "timestamp": now - timedelta(minutes=minute),
+            "ph": round(random.uniform(6.5, 8.5), 2),
+            "temperature": round(random.uniform(20, 30), 1),
+            "dissolved_oxygen": round(random.uniform(4, 12), 2),
+            "turbidity": round(random.uniform(0, 50), 1),
+            "salinity": round(random.uniform(15, 35), 2),
+            "ammonia": round(random.uniform(0, 5), 3),
+            "location": random.choice(["Tank A", "Tank B", "Tank C"]),
+            "sensor_id": random.choice(["SENSOR_001", "SENSOR_002", "SENSOR_003"])
+        })
+        if len(batch) == 5000:
+            db.sensor_data.insert_many(batch)
+            batch = []
+    if batch:
+        db.sensor_data.insert_many(batch)
+
+    print("🐟 Seeding a year of feeding schedules...")
+    today = datetime.combine(now.date(), datetime.min.time())
+    db.feeding_schedules.insert_many([
+        {
+            "date": today - timedelta(days=days_ago),
+            "time": time,
+            "amount_kg": round(random.uniform(1.5, 3.0), 1),
+            "status": "completed",
+            "tank": "Tank A"
+        }
+        for days_ago in range(365)
+        for time in ["06:00", "10:00", "14:00", "18:00", "22:00"]
+    ])
+
+    print("🚨 Seeding alerts...")
+    db.alerts.insert_many([
+        {
+            "timestamp": now - timedelta(minutes=random.randint(0, readings)),
+            "type": random.choice(["warning", "info", "success"]),
+            "message": "Seeded alert",
+            "sensor_id": "SENSOR_001",
+            "reading_id": ObjectId(),
+            "acknowledged": random.random() < 0.8
+        }
+        for _ in range(readings // 5)
+    ])
+
+    db.seed_system_settings()
+    # Start alert evaluation a day back so its batched path runs, not just the first-run path
+    db.system_settings.update_one({}, {"$set": {"alert_evaluation.last_evaluated": now - timedelta(days=1)}})
+    db.rollup_sensor_data(hours=readings // 60)
+
+def open_scratch_database(readings):
+    """Create, index and seed the scratch database, recording its queries"""
+    # The listener only sees clients created after it is registered
+    recorder = QueryRecorder()
+    monitoring.register(recorder)
+
+    db = AquaTechDB(database_name=SCRATCH_DATABASE)
+    if db.client is None:
+        return None, None
+
+    db.client.drop_database(db.database_name)
+    db.create_indexes()
+    seed_large_dataset(db, readings)
+    return db, recorder
+
+def close_scratch_database(db):
+    """Drop the scratch database and close its connection"""
+    db.client.drop_database(db.database_name)
+    db.close_connection()
+
+def check(readings):
+    """Audit a seeded scratch database and fail if any query scans a collection"""
+    db, recorder = open_scratch_database(readings)
+    if db is None:
+        return False
+
+    try:
+        shapes, skipped = collect_query_shapes(db, recorder)
+        results = audit(db, shapes)
+        scans = [result for result in results if "COLLSCAN" in result["issues"]]
+
+        print("\n" + "=" * 50)
+        if skipped:
+            print(f"❌ Couldn't run {', '.join(skipped)}: add their arguments to METHOD_ARGS")
+        if scans:
+            print(f"❌ {len(scans)} queries do a collection scan:")
+            for result in scans:
+                print(f"   {describe(result['shape'])} ({', '.join(result['shape']['used_by'])})")
+        if skipped or scans:
+            return False
+
+        print(f"✅ No query does a collection scan on {readings} readings")
+        return True
+    finally:
+        close_scratch_database(db)
+
+def main():
+    """Main advisor function"""
+    parser = argparse.ArgumentParser(description="Audit AquaTechDB query plans and recommend indexes")
+    parser.add_argument("--apply", action="store_true", help="create the recommended indexes")
+    parser.add_argument("--drop", action="store_true",
+                        help="drop indexes flagged for removal (never unique, TTL, partial or sparse ones); "
+                             "only AquaTechDB's queries are considered, so check other clients first")
+    parser.add_argument("--check", action="store_true", help="audit a large scratch database and fail on any collection scan")
+    parser.add_argument("--readings", type=int, default=50000, help="sensor readings to seed in the scratch database")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check(args.readings) else 1)
+
+    # Query shapes are collected on the scratch database, since some methods write
+    scratch, recorder = open_scratch_database(args.readings)
+    if scratch is None:
+        sys.exit(1)
+    try:
+        shapes, skipped = collect_query_shapes(scratch, recorder)
+    finally:
+        close_scratch_database(scratch)
+    if skipped:
+        print(f"⚠️ Couldn't run {', '.join(skipped)}: add their arguments to METHOD_ARGS")
+
+    db = AquaTechDB()
+    if db.client is None:
+        sys.exit(1)
+
+    audit(db, shapes, apply=args.apply, drop=args.drop)
+
+if __name__ == "__main__":
+    main()
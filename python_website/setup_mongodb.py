@@ -89,7 +89,7 @@ def test_database_connection():
     
     try:
         # Try to initialize database
-        db = AquaTechDB()
+        db = AquaTechDB(initialize=True)
         
         if db.client is None:
             print("❌ Failed to connect to MongoDB")
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Background Worker Pool for AquaTech
+
+Runs the write-heavy jobs (hourly rollups, alert evaluation, CSV exports and
+data retention) in a pool of worker processes so the Flask web tier only has
+to serve reads. A scheduler thread queues each job on its own interval and a
+dispatcher feeds the queue into the pool.
+
+Usage:
+    python workers.py                  # run the scheduler until Ctrl+C / SIGTERM
+    python workers.py rollups alerts   # run the named jobs once and exit
+"""
+
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from database import db
+
+EXPORT_DIR = os.getenv('AQUATECH_EXPORT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exports'))
+RETENTION_DAYS = int(os.getenv('AQUATECH_RETENTION_DAYS', '30'))
+
+# Jobs run inside the worker processes, each against that process's own connection
+JOBS = {
+    'rollups': lambda: db.rollup_sensor_data(hours=24),
+    'alerts': lambda: db.evaluate_alerts(),
+    'exports': lambda: db.export_sensor_data(EXPORT_DIR, hours=24),
+    'retention': lambda: db.purge_old_data(days=RETENTION_DAYS) + db.purge_old_exports(EXPORT_DIR, days=RETENTION_DAYS),
+}
+
+# How often each job is queued, in seconds
+SCHEDULE = {
+    'rollups': int(os.getenv('AQUATECH_ROLLUP_INTERVAL', '300')),
+    'alerts': int(os.getenv('AQUATECH_ALERT_INTERVAL', '60')),
+    'exports': int(os.getenv('AQUATECH_EXPORT_INTERVAL', '3600')),
+    'retention': int(os.getenv('AQUATECH_RETENTION_INTERVAL', '86400')),
+}
+
+def init_worker():
+    """Leave Ctrl+C and SIGTERM to the parent so in-flight jobs can finish cleanly"""
+    # Supervisors often signal the whole process group, workers included
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    # Since workers ignore SIGTERM, exit on our own if the parent dies uncleanly
+    parent = os.getppid()
+    threading.Thread(target=watch_parent, args=(parent,), name="watch-parent", daemon=True).start()
+
+def watch_parent(parent):
+    """Exit the worker process once its parent has gone away"""
+    while os.getppid() == parent:
+        time.sleep(5)
+    os._exit(1)
+
+def run_job(name):
+    """Run a single job in a worker process and time it"""
+    start = time.perf_counter()
+    result = JOBS[name]()
+    return name, result, time.perf_counter() - start
+
+class WorkerPool:
+    def __init__(self, workers=None):
+        # Each job runs at most once at a time, so more processes than jobs would sit idle
+        self.workers = workers or int(os.getenv('AQUATECH_WORKERS', min(os.cpu_count() or 1, len(JOBS))))
+        self.jobs = queue.Queue()
+        self.stopping = threading.Event()
+        self.in_flight = set()
+        self.lock = threading.Lock()
+        self.stats = {name: {"runs": 0, "failures": 0, "total_seconds": 0.0, "last_seconds": None} for name in JOBS}
+
+        self.executor = self.create_executor()
+
+    def create_executor(self):
+        """Start a fresh pool of worker processes"""
+        # Spawn rather than fork so no worker inherits the parent's MongoClient
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker
+        )
+
+    def submit(self, name):
+        """Queue a job unless the same job is already queued or running"""
+        with self.lock:
+            if name in self.in_flight:
+                return False
+            self.in_flight.add(name)
+        self.jobs.put((name, time.perf_counter()))
+        return True
+
+    def run_scheduler(self):
+        """Queue every job when its interval comes due"""
+        next_run = {name: time.monotonic() for name in SCHEDULE}
+
+        while not self.stopping.is_set():
+            now = time.monotonic()
+            for name, interval in SCHEDULE.items():
+                if now >= next_run[name]:
+                    self.submit(name)
+                    next_run[name] = now + interval
+            self.stopping.wait(1)
+
+    def dispatch(self, timeout=1):
+        """Hand the next queued job to the process pool"""
+        try:
+            name, queued_at = self.jobs.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+        try:
+            future = self.executor.submit(run_job, name)
+        except BrokenProcessPool as e:
+            # A worker died (OOM, driver crash); replace the whole pool and move on
+            with self.lock:
+                self.in_flight.discard(name)
+                self.stats[name]["failures"] += 1
+            print(f"❌ Job '{name}' failed: worker pool broken ({e}), restarting it")
+            self.executor.shutdown(wait=False)
+            self.executor = self.create_executor()
+            return None
+
+        future.add_done_callback(lambda f: self.job_done(name, f, queued_at))
+        return future
+
+    def job_done(self, name, future, queued_at):
+        """Record timing for a finished job"""
+        with self.lock:
+            self.in_flight.discard(name)
+            stats = self.stats[name]
+            try:
+                _, result, seconds = future.result()
+            except Exception as e:
+                stats["failures"] += 1
+                print(f"❌ Job '{name}' failed: {e}")
+                return
+
+            stats["runs"] += 1
+            stats["total_seconds"] += seconds
+            stats["last_seconds"] = seconds
+
+        waited = time.perf_counter() - queued_at - seconds
+        print(f"✅ Job '{name}' finished in {seconds:.3f}s (queued {waited:.3f}s): {result}")
+
+    def run_forever(self):
+        """Run the scheduler and dispatcher until asked to stop"""
+        scheduler = threading.Thread(target=self.run_scheduler, name="scheduler", daemon=True)
+        scheduler.start()
+        print(f"⚙️ Worker pool started with {self.workers} processes")
+
+        while not self.stopping.is_set():
+            self.dispatch()
+
+        scheduler.join()
+        self.shutdown()
+
+    def run_once(self, names):
+        """Run the given jobs once, wait for them and return True if all succeeded"""
+        futures = [self.dispatch(timeout=0) for name in names if self.submit(name)]
+        succeeded = True
+        for future in futures:
+            if future is None:
+                succeeded = False
+                continue
+            try:
+                future.result()
+            except Exception:
+                succeeded = False
+        self.shutdown()
+        return succeeded
+
+    def stop(self, *args):
+        """Signal handler: stop scheduling and let running jobs finish"""
+        if not self.stopping.is_set():
+            print("\n🛑 Shutting down worker pool, waiting for running jobs...")
+        self.stopping.set()
+
+    def shutdown(self):
+        """Drop queued jobs, wait for running ones and print timing stats"""
+        while True:
+            try:
+                name, _ = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            with self.lock:
+                self.in_flight.discard(name)
+
+        self.executor.shutdown(wait=True)
+
+        for name, stats in self.stats.items():
+            if stats["runs"] or stats["failures"]:
+                average = stats["total_seconds"] / stats["runs"] if stats["runs"] else 0
+                print(f"📊 {name}: {stats['runs']} runs, {stats['failures']} failures, avg {average:.3f}s")
+
+def main():
+    """Main worker entry point"""
+    names = sys.argv[1:]
+    unknown = [name for name in names if name not in JOBS]
+    if unknown:
+        print(f"❌ Unknown job(s): {', '.join(unknown)}. Choose from: {', '.join(JOBS)}")
+        sys.exit(1)
+
+    if db.client is None:
+        print("❌ Worker pool needs a MongoDB connection")
+        sys.exit(1)
+
+    # Indexes and sample data are owned by the workers, not the web tier
+    db.initialize()
+
+    pool = WorkerPool()
+    if names:
+        sys.exit(0 if pool.run_once(names) else 1)
+
+    signal.signal(signal.SIGINT, pool.stop)
+    signal.signal(signal.SIGTERM, pool.stop)
+    pool.run_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+"""
+WSGI entry point for running AquaTech under a production server
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Background jobs (rollups, alerts, exports, retention) run separately:
+
+    python workers.py
+"""
+from app import app
+
+if __name__ == "__main__":
+    app.run()